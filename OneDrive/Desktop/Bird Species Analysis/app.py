@@ -1,8 +1,12 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from sqlalchemy import create_engine
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, text, bindparam, Integer, String
+from sqlalchemy.exc import SQLAlchemyError
 from urllib.parse import quote_plus # For encoding password
 
 # --- Database Connection ---
@@ -17,54 +21,325 @@ PG_DB_NAME = 'bird_analysis_db'    # Your confirmed database name
 encoded_password = quote_plus(PG_PASSWORD)
 DATABASE_URL = f'postgresql://{PG_USERNAME}:{encoded_password}@{PG_HOST}:{PG_PORT}/{PG_DB_NAME}'
 
-@st.cache_data # Cache data to avoid re-running every time the app reloads
-def get_data_from_sql():
-    """Fetches data from the SQL database and performs initial processing for dashboard."""
-    engine = create_engine(DATABASE_URL)
+# One engine per server process: its connection pool is reused by every chart query
+# and rerun instead of opening a fresh connection (TCP handshake + auth) per query
+@st.cache_resource
+def get_engine():
+    """Creates the shared SQLAlchemy engine for the dashboard's aggregate queries."""
+    return create_engine(DATABASE_URL, pool_size=4, max_overflow=0)
+
+# --- Parquet Snapshot ---
+# Written by data_ingestion.py; the dashboard reads only the columns it uses.
+PARQUET_PATH = 'bird_observations.parquet'
+USED_COLS = [
+    'Date', 'Start_Time', 'Location_Type', 'Observer', 'Common_Name', 'Site_Name',
+    'Plot_Name', 'Admin_Unit_Code', 'Visit', 'ID_Method', 'Distance', 'Sex',
+    'Flyover_Observed', 'PIF_Watchlist_Status', 'Regional_Stewardship_Status',
+    'Temperature', 'Humidity', 'Wind', 'Disturbance'
+]
+
+# Repetitive text columns stored as pandas categoricals (integer codes instead of Python strings)
+CATEGORICAL_COLS = [
+    'Location_Type', 'Observer', 'Common_Name', 'Site_Name', 'ID_Method',
+    'Wind', 'Disturbance', 'Sex', 'Plot_Name', 'Admin_Unit_Code'
+]
+
+def reduce_mem_usage(df):
+    """Downcasts numeric columns to the smallest fitting dtype and low-cardinality text columns to categoricals."""
+    for col in df.columns:
+        if col in CATEGORICAL_COLS:
+            if df[col].nunique() < 0.5 * len(df):
+                df[col] = df[col].astype('category')
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='float')
+    return df
+
+def histogram_counts(values, bins, label_column):
+    """Histogram of a numeric array as a [label_column, 'Count'] frame with 'low-high' range labels, in bin order."""
+    counts, edges = np.histogram(values, bins=bins)
+    decimals = 0 if edges[1] - edges[0] >= 1 else 1 # Keep labels distinct for narrow bins
+    labels = [f"{low:.{decimals}f}-{high:.{decimals}f}" for low, high in zip(edges[:-1], edges[1:])]
+    return pd.DataFrame({label_column: labels, 'Count': counts})
+
+def observed_value_counts(series):
+    """value_counts() without the zero-count categories a categorical column reports for filtered-out values."""
+    counts = series.value_counts()
+    return counts[counts > 0]
+
+def category_mask(series, values):
+    """Boolean NumPy mask of rows whose value is in `values`, compared on integer category codes."""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.isin(values).to_numpy()
+    codes = series.cat.categories.get_indexer(list(values))
+    return np.isin(series.cat.codes.to_numpy(), codes[codes >= 0])
+
+# Cached as a shared resource: st.cache_data would pickle and unpickle the whole
+# frame on every rerun. The dashboard only reads from it, never modifies it in place.
+@st.cache_resource
+def get_data_from_parquet():
+    """Loads the used columns from the Parquet snapshot and performs initial processing for dashboard."""
     try:
-        # Use double quotes for table name and column names for PostgreSQL case sensitivity
-        df = pd.read_sql('SELECT * FROM "bird_observations"', engine)
+        # The Arrow table is local, so it is freed once the frame is built; only the frame stays cached
+        table = pq.read_table(PARQUET_PATH, columns=USED_COLS)
+        # Start_Time is stored as an Arrow time column, so the hour is read straight from it
+        # without building a Timestamp per row; the column itself is not needed in the frame
+        observation_hour = pc.hour(table['Start_Time']).fill_null(-1).to_numpy().astype(np.int8) # -1 for unknown
+        df = table.drop_columns(['Start_Time']).to_pandas()
         
-        # Ensure correct data types for Streamlit/Plotly after fetching from SQL
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        # Fill missing year/month with 0 or a placeholder if Date is NaT,
-        # otherwise they might cause errors in numeric conversions.
-        df['ObservationYear'] = df['Date'].dt.year.fillna(0).astype(int) 
-        df['ObservationMonth'] = df['Date'].dt.month.fillna(0).astype(int)
-        
-        # Convert Start_Time to datetime objects to extract hour
-        df['Start_Time_DT'] = pd.to_datetime(df['Start_Time'], format='%H:%M:%S', errors='coerce')
-        df['ObservationHour'] = df['Start_Time_DT'].dt.hour.fillna(-1).astype(int) # Fill with -1 for unknown/unparsed
+        # Ensure correct data types for Streamlit/Plotly after loading
+        # (an explicit format keeps pandas on its fast C parser instead of guessing per element)
+        df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d', errors='coerce', cache=True)
+        # Year and month from one pass over the datetime64 buffer (as months since 1970) instead of
+        # two .dt accessor walks; nullable integers keep missing year/month as <NA> when Date is NaT
+        month_index = df['Date'].to_numpy().astype('datetime64[M]')
+        missing_date = np.isnat(month_index)
+        months_since_epoch = month_index.astype(np.int64)
+        df['ObservationYear'] = pd.arrays.IntegerArray((months_since_epoch // 12 + 1970).astype(np.int16), missing_date)
+        df['ObservationMonth'] = pd.arrays.IntegerArray((months_since_epoch % 12 + 1).astype(np.int8), missing_date)
+        df['ObservationHour'] = observation_hour
 
         # Convert Distance to an ordered categorical type for better plotting order
         distance_order = ['<=50 Meters', '50-100 Meters', '>100 Meters', 'Unknown'] # Ensure 'Unknown' is last
         df['Distance'] = pd.Categorical(df['Distance'], categories=distance_order, ordered=True)
         
-        # Convert Distance to a sortable numeric for better plotting if needed
-        def convert_distance_numeric(dist_str):
-            if pd.isna(dist_str) or str(dist_str).strip().lower() == 'unknown':
-                return None
-            dist_str = str(dist_str).strip().lower()
-            if '<=50 meters' in dist_str:
-                return 25
-            elif '50-100 meters' in dist_str:
-                return 75
-            elif '>100 meters' in dist_str:
-                return 125
-            return None
-        df['Distance_Numeric'] = df['Distance'].apply(convert_distance_numeric)
-
-        # Ensure boolean columns are actual booleans for Plotly and filtering
-        df['PIF_Watchlist_Status'] = df['PIF_Watchlist_Status'].astype(bool)
-        df['Regional_Stewardship_Status'] = df['Regional_Stewardship_Status'].astype(bool)
-        df['Flyover_Observed'] = df['Flyover_Observed'].astype(bool)
-
-        return df
+        # Convert Distance to a sortable numeric (band midpoint) for better plotting if needed,
+        # looked up once per category instead of once per row
+        distance_midpoints = pd.Series([25.0, 75.0, 125.0, np.nan], index=distance_order)
+        df['Distance_Numeric'] = df['Distance'].map(distance_midpoints).astype('float32')
+
+        # PIF_Watchlist_Status, Regional_Stewardship_Status and Flyover_Observed are written as
+        # booleans by data_ingestion.py, so they load as bool and need no re-casting here.
+        # Combined conservation flag, derived once here instead of OR-ing the two columns per rerun
+        df['IsAtRisk'] = np.bitwise_or(df['PIF_Watchlist_Status'].to_numpy(), df['Regional_Stewardship_Status'].to_numpy())
+
+        return reduce_mem_usage(df)
     except Exception as e:
-        st.error(f"Error connecting to PostgreSQL database or fetching data: {e}")
-        st.error("Please ensure your PostgreSQL server is running and connection details in app.py are correct.")
+        st.error(f"Error reading observation data from '{PARQUET_PATH}': {e}")
+        st.error("Please ensure data_ingestion.py was run successfully to create the Parquet snapshot.")
         return pd.DataFrame()
 
+# --- Aggregate Queries ---
+# Each chart asks PostgreSQL for its own small GROUP BY result with the sidebar
+# filters applied as bind parameters, so only ~10-100 rows travel per chart.
+FILTER_PREDICATES = '''
+    "Location_Type" IN :habitats
+    AND EXTRACT(YEAR FROM "Date") IN :years
+    AND "Observer" IN :observers
+'''
+
+def run_aggregate_query(query, years, observers, habitats, **params):
+    """Runs an aggregate query with the global filters bound as SQL predicates."""
+    statement = text(query.format(filters=FILTER_PREDICATES)).bindparams(
+        bindparam('years', expanding=True, type_=Integer),
+        bindparam('observers', expanding=True, type_=String),
+        bindparam('habitats', expanding=True, type_=String)
+    )
+    params.update(years=list(years), observers=list(observers), habitats=list(habitats))
+    with get_engine().connect() as conn:
+        return pd.read_sql(statement, conn, params=params)
+
+@st.cache_data
+def fetch_top_species(years, observers, habitats, limit=10):
+    """Most frequently observed species under the current filters."""
+    return run_aggregate_query('''
+        SELECT "Common_Name", COUNT(*) AS "Count"
+        FROM "bird_observations"
+        WHERE {filters}
+        GROUP BY "Common_Name"
+        ORDER BY "Count" DESC, "Common_Name"
+        LIMIT :limit
+    ''', years, observers, habitats, limit=limit)
+
+@st.cache_data
+def fetch_site_counts(years, observers, habitats, limit=15):
+    """Sites with the most observations."""
+    return run_aggregate_query('''
+        SELECT "Site_Name", COUNT(*) AS "Count"
+        FROM "bird_observations"
+        WHERE {filters}
+        GROUP BY "Site_Name"
+        ORDER BY "Count" DESC, "Site_Name"
+        LIMIT :limit
+    ''', years, observers, habitats, limit=limit)
+
+# Column names cannot be bind parameters, so only these are accepted below
+STATUS_COLUMNS = ('PIF_Watchlist_Status', 'Regional_Stewardship_Status')
+
+@st.cache_data
+def fetch_status_counts(status_column, years, observers, habitats):
+    """Observation counts split by a boolean conservation status column."""
+    if status_column not in STATUS_COLUMNS:
+        raise ValueError(f"Unsupported status column: {status_column}")
+    return run_aggregate_query(f'''
+        SELECT "{status_column}" AS "Status", COUNT(*) AS "Count"
+        FROM "bird_observations"
+        WHERE {{filters}}
+        GROUP BY 1
+    ''', years, observers, habitats)
+
+@st.cache_data
+def fetch_top_observers(years, observers, habitats, limit=10):
+    """Observers with the most recorded observations."""
+    return run_aggregate_query('''
+        SELECT "Observer", COUNT(*) AS "Count"
+        FROM "bird_observations"
+        WHERE {filters}
+        GROUP BY "Observer"
+        ORDER BY "Count" DESC, "Observer"
+        LIMIT :limit
+    ''', years, observers, habitats, limit=limit)
+
+def fetch_or_report(fetch, *args, **kwargs):
+    """
+    Calls a fetch_* query; if PostgreSQL cannot be reached, shows the error in place of
+    that chart and returns None so the rest of the dashboard still renders.
+    (Failed calls are not cached, so the chart comes back once the database does.)
+    """
+    try:
+        return fetch(*args, **kwargs)
+    except SQLAlchemyError as e:
+        st.error(f"Could not load this chart from PostgreSQL: {e}")
+        st.info("Please ensure your PostgreSQL server is running and connection details are correct.")
+        return None
+
+@st.cache_data
+def column_universe(_df):
+    """Sorted option arrays for the sidebar filters, computed once per loaded dataset."""
+    def options(series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return np.sort(series.cat.categories.to_numpy())
+        return np.sort(series.dropna().unique())
+    return {
+        'loc': options(_df['Location_Type']),
+        'obs': options(_df['Observer']),
+        'years': np.sort(_df['ObservationYear'].dropna().unique().astype(int)),
+        # Species come from the full dataset, so the list does not change with the other filters
+        'species': [name for name in options(_df['Common_Name']) if name and name != 'Unknown'],
+    }
+
+# --- Cached Aggregations ---
+# The filtered frame is passed unhashed (leading underscore); the hashable filter
+# tuples form the cache key, so reruns triggered by unrelated widgets (e.g. the
+# species selectbox) reuse the small result frames instead of regrouping.
+@st.cache_data
+def agg_key_metrics(_filtered_df, years, observers, habitats):
+    """Headline KPI values for the overview tab."""
+    return {
+        'observations': _filtered_df.shape[0],
+        'species': _filtered_df['Common_Name'].nunique(),
+        'sites': _filtered_df['Site_Name'].nunique(),
+        'avg_temp': _filtered_df['Temperature'].mean()
+    }
+
+@st.cache_data
+def agg_value_counts(_filtered_df, column, years, observers, habitats):
+    """Observation counts per value of a column, as a [column, 'Count'] frame."""
+    counts = observed_value_counts(_filtered_df[column]).reset_index()
+    counts.columns = [column, 'Count']
+    return counts
+
+@st.cache_data
+def agg_year_month(_filtered_df, years, observers, habitats):
+    """
+    Dense year x month table of observation counts (rows: observed years, columns: months 1-12),
+    skipping rows whose date failed to parse.
+    """
+    month_columns = pd.Index(np.arange(1, 13), name='ObservationMonth')
+    valid = _filtered_df['ObservationMonth'].notna().to_numpy()
+    obs_years = _filtered_df['ObservationYear'].to_numpy(dtype=np.int16, na_value=-1)[valid]
+    obs_months = _filtered_df['ObservationMonth'].to_numpy(dtype=np.int8, na_value=0)[valid]
+    if obs_years.size == 0:
+        return pd.DataFrame(columns=month_columns, dtype=np.int64)
+
+    # One dense counting pass into a (year, month) grid; month 0 is an unused pad column
+    first_year = int(obs_years.min())
+    n_years = int(obs_years.max()) - first_year + 1
+    cell = (obs_years - first_year).astype(np.int64) * 13 + obs_months
+    grid = np.bincount(cell, minlength=n_years * 13).reshape(n_years, 13)[:, 1:]
+    observed = grid.any(axis=1) # Like pd.crosstab, only years with observations get a row
+    year_index = pd.Index(np.arange(first_year, first_year + n_years)[observed], name='ObservationYear')
+    return pd.DataFrame(grid[observed], index=year_index, columns=month_columns)
+
+@st.cache_data
+def agg_monthly_counts(_filtered_df, years, observers, habitats):
+    """Observation counts per calendar month (1-12), skipping rows whose date failed to parse."""
+    months = _filtered_df['ObservationMonth'].to_numpy(dtype=np.int8, na_value=0)
+    counts = np.bincount(months, minlength=13)[1:] # Bin 0 collects the missing months
+    present = np.flatnonzero(counts)
+    return pd.DataFrame({'ObservationMonth': present + 1, 'Count': counts[present]})
+
+@st.cache_data
+def agg_hourly_counts(_filtered_df, years, observers, habitats):
+    """Observation counts per hour of day (0-23), skipping rows without a parsed start time."""
+    hours = _filtered_df['ObservationHour'].to_numpy()
+    counts = np.bincount(hours[hours >= 0], minlength=24) # Unparsed times are stored as -1
+    present = np.flatnonzero(counts)
+    return pd.DataFrame({'Hour': present, 'Count': counts[present]})
+
+@st.cache_data
+def agg_species_diversity_by_habitat(_filtered_df, years, observers, habitats):
+    """Unique species count per habitat type."""
+    # Only the few resulting habitat rows are sorted, after grouping
+    species_per_habitat = _filtered_df.groupby('Location_Type', observed=True, sort=False)['Common_Name'].nunique()
+    return species_per_habitat.sort_index().reset_index(name='Unique_Species_Count')
+
+@st.cache_data
+def agg_plot_diversity(_filtered_df, years, observers, habitats, limit=10):
+    """Plots with the most unique species."""
+    # nlargest is a partial selection; no need to sort every plot to keep the top few
+    plot_diversity = _filtered_df.groupby(['Admin_Unit_Code', 'Plot_Name'], observed=True, sort=False)['Common_Name'].nunique()
+    return plot_diversity.nlargest(limit).reset_index(name='Unique_Species_Count')
+
+@st.cache_data
+def agg_temperature_bins(_filtered_df, years, observers, habitats):
+    """Observation counts per temperature range (empty if no temperature data)."""
+    # Filter out NaN temperatures before binning
+    valid_temp_df = _filtered_df[_filtered_df['Temperature'].notna()]
+    if valid_temp_df.empty:
+        return pd.DataFrame(columns=['Temp_Bin', 'Count'])
+
+    # Dynamically determine bins or use fixed ones if data range is limited
+    temp_min = valid_temp_df['Temperature'].min()
+    temp_max = valid_temp_df['Temperature'].max()
+    num_bins = 10 if (temp_max - temp_min) > 10 else max(2, int(temp_max - temp_min)) # At least 2 bins
+    if num_bins == 0: num_bins = 1 # Handle case where all temps are same
+
+    return histogram_counts(valid_temp_df['Temperature'].to_numpy(dtype=np.float32), num_bins, 'Temp_Bin')
+
+@st.cache_data
+def agg_humidity_bins(_filtered_df, years, observers, habitats):
+    """Observation counts per humidity range (empty if no humidity data)."""
+    valid_humidity = _filtered_df['Humidity'].dropna()
+    if valid_humidity.empty:
+        return pd.DataFrame(columns=['Humidity_Range', 'Count'])
+
+    return histogram_counts(valid_humidity.to_numpy(dtype=np.float32), 5, 'Humidity_Range')
+
+@st.cache_data
+def agg_at_risk_species(_filtered_df, years, observers, habitats):
+    """Observation counts of PIF Watchlist or Regional Stewardship species per habitat."""
+    # Sum the at-risk flag per group in one pass instead of materializing the at-risk rows first
+    at_risk_counts = _filtered_df['IsAtRisk'].groupby(
+        [_filtered_df['Location_Type'], _filtered_df['Common_Name']], observed=True, sort=False
+    ).sum() # The chart orders the bars by count itself
+    return at_risk_counts[at_risk_counts > 0].reset_index(name='Count')
+
+@st.cache_data
+def agg_observer_unique_species(_filtered_df, years, observers, habitats, limit=10):
+    """Observers who recorded the most unique species."""
+    observer_unique_species = _filtered_df.groupby('Observer', observed=True, sort=False)['Common_Name'].nunique().nlargest(limit).reset_index(name='Unique Species Count')
+    observer_unique_species.columns = ['Observer', 'Unique Species Count']
+    return observer_unique_species
+
+@st.cache_data
+def agg_visit_patterns(_filtered_df, years, observers, habitats, limit=10):
+    """Observation counts per visit number for the most observed sites."""
+    visit_counts = _filtered_df.groupby(['Site_Name', 'Visit'], observed=True, sort=False).size().reset_index(name='Count')
+    top_sites_visits = visit_counts.groupby('Site_Name', observed=True, sort=False)['Count'].sum().nlargest(limit).index
+    return visit_counts[visit_counts['Site_Name'].isin(top_sites_visits)].sort_values(['Site_Name', 'Visit'])
+
 # --- Streamlit Page Configuration ---
 st.set_page_config(
     page_title="Bird Species Observation Analysis",
@@ -74,64 +349,62 @@ st.set_page_config(
 )
 
 # --- Load Data ---
-df = get_data_from_sql()
+df = get_data_from_parquet()
 
 if df.empty:
-    st.warning("No data available to display. Please ensure data_ingestion.py was run successfully and your PostgreSQL server is accessible.")
+    st.warning("No data available to display. Please ensure data_ingestion.py was run successfully.")
     st.stop() # Stop if no data is loaded
 
 # --- Sidebar Filters ---
 st.sidebar.header("Global Filters")
 
-all_location_types = df['Location_Type'].unique()
-selected_location_type = st.sidebar.multiselect(
+universe = column_universe(df)
+all_location_types = universe['loc']
+# Filter selections are kept as tuples so they hash to stable cache keys
+selected_location_type = tuple(st.sidebar.multiselect(
     "Select Habitat Type(s)",
     options=all_location_types,
     default=all_location_types,
     help="Filter observations by forest or grassland habitats."
-)
+))
 
 # --- UPDATED: Year filter changed from slider to multi-select ---
-# Get all unique valid years (exclude 0 if it exists from date parsing errors)
-all_years = sorted(df[df['ObservationYear'] > 0]['ObservationYear'].unique().tolist())
+# Get all unique valid years (missing years from date parsing errors are <NA>)
+all_years = universe['years'].tolist()
 if not all_years: # If no valid years, provide a warning
     st.sidebar.warning("No valid years found in data for filtering.")
-    selected_years = [] # No years selected if no valid data
+    selected_years = () # No years selected if no valid data
 else:
-    selected_years = st.sidebar.multiselect(
+    selected_years = tuple(st.sidebar.multiselect(
         "Select Year(s)",
         options=all_years,
         default=all_years, # Default to selecting all years
         help="Filter observations by specific year(s)."
-    )
+    ))
 
-all_observers = df['Observer'].unique()
-selected_observers = st.sidebar.multiselect(
+all_observers = universe['obs']
+selected_observers = tuple(st.sidebar.multiselect(
     "Select Observer(s)",
     options=all_observers,
     default=all_observers,
     help="Filter observations by the person who recorded them."
-)
+))
 
 # Apply global filters
-# Adjusted filter logic for selected_years (now a list)
-if not selected_years: # If no years are selected, treat as no data selected for year
-    filtered_df = pd.DataFrame() # Return empty DataFrame
-else:
-    filtered_df = df[
-        (df['Location_Type'].isin(selected_location_type)) &
-        (df['ObservationYear'].isin(selected_years)) & # Changed for multiselect
-        (df['Observer'].isin(selected_observers))
-    ]
+# Each filter is a NumPy bool array, ANDed in place and applied with a single positional take.
+# No selected years gives an all-False mask, i.e. an empty frame that still has every column.
+mask = category_mask(df['Location_Type'], selected_location_type)
+year_values = df['ObservationYear'].to_numpy(dtype=np.int16, na_value=-1) # Missing years never match
+np.logical_and(mask, np.isin(year_values, np.asarray(selected_years, dtype=np.int16)), out=mask)
+np.logical_and(mask, category_mask(df['Observer'], selected_observers), out=mask)
+filtered_df = df.iloc[np.flatnonzero(mask)]
 
 st.sidebar.markdown("---")
 st.sidebar.subheader("Explore Specific Species")
-# Ensure 'Unknown' common name is excluded from species selection if desired
-all_common_names = filtered_df['Common_Name'].unique()
-species_options = sorted([name for name in all_common_names if name and name != 'Unknown'])
+# 'Unknown' common name is excluded from the precomputed species options
 selected_species = st.sidebar.selectbox(
     "Select a Species (for detailed view)",
-    options=['All Species'] + species_options,
+    options=['All Species'] + universe['species'],
     index=0
 )
 
@@ -143,6 +416,8 @@ st.markdown("A comprehensive analysis of bird species distribution, diversity, a
 if filtered_df.empty:
     st.warning("No data available for the selected filters. Please adjust your selections in the sidebar.")
 else:
+    filters = (selected_years, selected_observers, selected_location_type)
+
     # --- Tabbed Navigation ---
     tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "📊 Overview & Key Metrics",
@@ -156,36 +431,36 @@ else:
     with tab1:
         st.header("Dashboard Overview")
         st.markdown("### Key Performance Indicators")
+        key_metrics = agg_key_metrics(filtered_df, *filters)
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Observations", filtered_df.shape[0])
+            st.metric("Total Observations", key_metrics['observations'])
         with col2:
-            st.metric("Unique Species Observed", filtered_df['Common_Name'].nunique())
+            st.metric("Unique Species Observed", key_metrics['species'])
         with col3:
-            st.metric("Unique Sites", filtered_df['Site_Name'].nunique())
+            st.metric("Unique Sites", key_metrics['sites'])
         with col4:
-            avg_temp = filtered_df['Temperature'].mean()
+            avg_temp = key_metrics['avg_temp']
             st.metric("Avg. Temp Across Obs.", f"{avg_temp:.1f} °C" if pd.notna(avg_temp) else "N/A")
 
         st.markdown("---")
         st.subheader("Top 10 Most Observed Species")
-        top_species = filtered_df['Common_Name'].value_counts().nlargest(10).reset_index()
-        top_species.columns = ['Common_Name', 'Count']
-        fig_top_species = px.bar(
-            top_species,
-            x='Common_Name',
-            y='Count',
-            color='Common_Name',
-            title='Top 10 Most Frequently Observed Bird Species',
-            labels={'Common_Name': 'Bird Species', 'Count': 'Number of Observations'},
-            text='Count'
-        )
-        fig_top_species.update_layout(showlegend=False)
-        st.plotly_chart(fig_top_species, use_container_width=True)
+        top_species = fetch_or_report(fetch_top_species, *filters)
+        if top_species is not None:
+            fig_top_species = px.bar(
+                top_species,
+                x='Common_Name',
+                y='Count',
+                color='Common_Name',
+                title='Top 10 Most Frequently Observed Bird Species',
+                labels={'Common_Name': 'Bird Species', 'Count': 'Number of Observations'},
+                text='Count'
+            )
+            fig_top_species.update_layout(showlegend=False)
+            st.plotly_chart(fig_top_species, use_container_width=True)
 
         st.subheader("Observation Method Distribution")
-        id_method_counts = filtered_df['ID_Method'].value_counts().reset_index()
-        id_method_counts.columns = ['ID_Method', 'Count']
+        id_method_counts = agg_value_counts(filtered_df, 'ID_Method', *filters)
         fig_id_method = px.pie(
             id_method_counts,
             values='Count',
@@ -200,11 +475,11 @@ else:
         
         # Observations by Month
         st.subheader("Monthly Observation Patterns")
-        # Filter out rows where date parsing might have failed (ObservationMonth is 0)
-        valid_temporal_df = filtered_df[filtered_df['ObservationMonth'] > 0] 
+        # Rows where date parsing might have failed (ObservationMonth is <NA>) are skipped
+        monthly_yearly_counts = agg_year_month(filtered_df, *filters)
         
-        if not valid_temporal_df.empty:
-            observations_by_month = valid_temporal_df.groupby('ObservationMonth').size().reset_index(name='Count')
+        if not monthly_yearly_counts.empty:
+            observations_by_month = agg_monthly_counts(filtered_df, *filters)
             month_names = {1: 'Jan', 2: 'Feb', 3: 'Mar', 4: 'Apr', 5: 'May', 6: 'Jun', 
                            7: 'Jul', 8: 'Aug', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dec'}
             observations_by_month['Month_Name'] = observations_by_month['ObservationMonth'].map(month_names)
@@ -222,8 +497,9 @@ else:
 
         # Observations over Years (Line Chart)
         st.subheader("Observations Over Time (Yearly View)")
-        if not valid_temporal_df.empty:
-            observations_by_year = valid_temporal_df.groupby('ObservationYear').size().reset_index(name='Count')
+        if not monthly_yearly_counts.empty:
+            # Yearly totals are the row sums of the year x month table the monthly view already built
+            observations_by_year = monthly_yearly_counts.sum(axis=1).rename('Count').reset_index()
             fig_yearly_line = px.line(
                 observations_by_year,
                 x='ObservationYear',
@@ -237,12 +513,10 @@ else:
             st.info("No valid date data for yearly analysis in selected range.")
 
         st.subheader("Hourly Observation Patterns")
-        # Filter out invalid hours (-1) for plotting
-        valid_hourly_df = filtered_df[filtered_df['ObservationHour'] != -1]
+        # Rows without a parsed start time are excluded
+        hourly_counts = agg_hourly_counts(filtered_df, *filters)
         
-        if not valid_hourly_df.empty:
-            hourly_counts = valid_hourly_df['ObservationHour'].value_counts().sort_index().reset_index()
-            hourly_counts.columns = ['Hour', 'Count']
+        if not hourly_counts.empty:
             fig_hourly = px.bar(
                 hourly_counts,
                 x='Hour',
@@ -256,21 +530,19 @@ else:
 
         # New: Temporal Heatmap (Year vs Month)
         st.subheader("Observations Heatmap: Year vs. Month")
-        if not valid_temporal_df.empty:
-            monthly_yearly_counts = valid_temporal_df.groupby(['ObservationYear', 'ObservationMonth']).size().reset_index(name='Count')
-            # Map month numbers to names for better readability
-            monthly_yearly_counts['Month_Name'] = monthly_yearly_counts['ObservationMonth'].map(month_names)
+        if not monthly_yearly_counts.empty:
+            # Map month numbers to names for better readability; years become category labels
+            heatmap_counts = monthly_yearly_counts.rename(columns=month_names)
+            heatmap_counts.index = heatmap_counts.index.astype(str)
             
-            fig_heatmap = px.density_heatmap(
-                monthly_yearly_counts,
-                x="Month_Name",
-                y="ObservationYear",
-                z="Count",
-                nbinsx=12,
+            # The counts are already a dense matrix, so it is drawn directly without Plotly re-binning it
+            fig_heatmap = px.imshow(
+                heatmap_counts,
+                origin='lower', # Earliest year at the bottom
+                aspect='auto',
                 title="Observation Count by Month and Year (Heatmap)",
-                labels={'Month_Name': 'Month', 'ObservationYear': 'Year', 'Count': 'Observations'},
-                color_continuous_scale="Viridis",
-                category_orders={"Month_Name": list(month_names.values())} # Ensure months are in order
+                labels={'x': 'Month', 'y': 'Year', 'color': 'Observations'},
+                color_continuous_scale="Viridis"
             )
             st.plotly_chart(fig_heatmap, use_container_width=True)
         else:
@@ -281,7 +553,7 @@ else:
         
         # Species diversity by Location Type
         st.subheader("Species Diversity Across Habitat Types")
-        species_diversity_loc = filtered_df.groupby('Location_Type')['Common_Name'].nunique().reset_index(name='Unique_Species_Count')
+        species_diversity_loc = agg_species_diversity_by_habitat(filtered_df, *filters)
         fig_diversity_loc = px.bar(
             species_diversity_loc,
             x='Location_Type',
@@ -295,23 +567,22 @@ else:
 
         # Observations per Site
         st.subheader("Observations by Site Name")
-        obs_per_site = filtered_df['Site_Name'].value_counts().reset_index(name='Count')
-        obs_per_site.columns = ['Site_Name', 'Count']
-        fig_site = px.bar(
-            obs_per_site.nlargest(15, 'Count'), # Show top 15 sites
-            x='Site_Name',
-            y='Count',
-            color='Count',
-            title='Top 15 Observation Sites (by Count)',
-            labels={'Site_Name': 'Site Name', 'Count': 'Number of Observations'}
-        )
-        st.plotly_chart(fig_site, use_container_width=True)
+        obs_per_site = fetch_or_report(fetch_site_counts, *filters, limit=15)
+        if obs_per_site is not None:
+            fig_site = px.bar(
+                obs_per_site, # Top 15 sites
+                x='Site_Name',
+                y='Count',
+                color='Count',
+                title='Top 15 Observation Sites (by Count)',
+                labels={'Site_Name': 'Site Name', 'Count': 'Number of Observations'}
+            )
+            st.plotly_chart(fig_site, use_container_width=True)
 
         # Plot-Level Analysis (if many plots, use a table or filter)
         st.subheader("Plot-Level Insights (Top 10 Plots by Unique Species)")
-        plot_diversity = filtered_df.groupby(['Admin_Unit_Code', 'Plot_Name'])['Common_Name'].nunique().reset_index(name='Unique_Species_Count')
-        plot_diversity_sorted = plot_diversity.sort_values(by='Unique_Species_Count', ascending=False)
-        st.dataframe(plot_diversity_sorted.head(10), use_container_width=True) # Show top 10 plots
+        plot_diversity_sorted = agg_plot_diversity(filtered_df, *filters, limit=10)
+        st.dataframe(plot_diversity_sorted, use_container_width=True) # Show top 10 plots
         st.markdown("*(Note: This table shows top plots. Filter by Admin Unit or Plot Name in the sidebar for more specific details if implemented.)*")
 
 
@@ -319,24 +590,9 @@ else:
         st.header("Environmental Factors: How Weather Influences Birds")
 
         st.subheader("Temperature vs. Observation Count/Diversity")
-        # Filter out NaN temperatures before binning
-        valid_temp_df = filtered_df[filtered_df['Temperature'].notna()]
-
-        if not valid_temp_df.empty:
-            # Dynamically determine bins or use fixed ones if data range is limited
-            temp_min = valid_temp_df['Temperature'].min()
-            temp_max = valid_temp_df['Temperature'].max()
-            num_bins = 10 if (temp_max - temp_min) > 10 else max(2, int(temp_max - temp_min)) # At least 2 bins
-            if num_bins == 0: num_bins = 1 # Handle case where all temps are same
-
-            # Use pd.cut to create bins, ensure unique bin labels
-            temp_bins = pd.cut(valid_temp_df['Temperature'], bins=num_bins, precision=0, include_lowest=True)
-            # Convert Interval to string to handle cases where pandas gives complex Interval objects
-            temp_bins_str = temp_bins.astype(str)
-
-            temp_obs = temp_bins_str.value_counts().sort_index().reset_index(name='Count')
-            temp_obs.columns = ['Temp_Bin', 'Count'] # Rename columns for clarity
-            
+        temp_obs = agg_temperature_bins(filtered_df, *filters)
+
+        if not temp_obs.empty:
             fig_temp_count = px.bar(
                 temp_obs,
                 x='Temp_Bin',
@@ -351,32 +607,22 @@ else:
         st.subheader("Humidity and Wind Conditions")
         col_env1, col_env2 = st.columns(2)
         with col_env1:
-            # Filter out 'Unknown' humidity if it's there as a categorical fill and NaNs
-            valid_humidity_df = filtered_df[filtered_df['Humidity'].notna() & (filtered_df['Humidity'] != 'Unknown')]
-            if not valid_humidity_df.empty:
-                # Ensure humidity is numeric before binning
-                valid_humidity_df['Humidity'] = pd.to_numeric(valid_humidity_df['Humidity'], errors='coerce')
-                valid_humidity_df = valid_humidity_df.dropna(subset=['Humidity']) # Drop any NaNs from coerce
-
-                if not valid_humidity_df.empty:
-                    humidity_bins = pd.cut(valid_humidity_df['Humidity'], bins=5, precision=0, include_lowest=True).astype(str)
-                    humidity_counts = humidity_bins.value_counts().sort_index().reset_index(name='Count')
-                    humidity_counts.columns = ['Humidity_Range', 'Count']
-                    fig_humidity = px.bar(
-                        humidity_counts,
-                        x='Humidity_Range',
-                        y='Count',
-                        title='Observations by Humidity Range',
-                        labels={'Humidity_Range': 'Humidity (%)', 'Count': 'Number of Observations'}
-                    )
-                    st.plotly_chart(fig_humidity, use_container_width=True)
-                else:
-                    st.info("No valid humidity data after numeric conversion.")
+            # Humidity is numeric after cleaning; only NaNs need to be skipped
+            humidity_counts = agg_humidity_bins(filtered_df, *filters)
+            if not humidity_counts.empty:
+                fig_humidity = px.bar(
+                    humidity_counts,
+                    x='Humidity_Range',
+                    y='Count',
+                    title='Observations by Humidity Range',
+                    labels={'Humidity_Range': 'Humidity (%)', 'Count': 'Number of Observations'}
+                )
+                st.plotly_chart(fig_humidity, use_container_width=True)
             else:
                 st.info("No valid humidity data for plotting.")
 
         with col_env2:
-            wind_counts = filtered_df['Wind'].value_counts().reset_index(name='Count')
+            wind_counts = agg_value_counts(filtered_df, 'Wind', *filters)
             wind_counts.columns = ['Wind_Condition', 'Count']
             fig_wind = px.bar(
                 wind_counts,
@@ -389,7 +635,7 @@ else:
             st.plotly_chart(fig_wind, use_container_width=True)
         
         st.subheader("Impact of Disturbances on Observations")
-        disturbance_effect = filtered_df['Disturbance'].value_counts().reset_index(name='Count')
+        disturbance_effect = agg_value_counts(filtered_df, 'Disturbance', *filters)
         disturbance_effect.columns = ['Disturbance_Type', 'Count']
         fig_disturbance = px.bar(
             disturbance_effect,
@@ -406,36 +652,34 @@ else:
         st.markdown("Analyzing species based on their conservation watchlist and stewardship status to identify at-risk populations.")
 
         st.subheader("PIF Watchlist Status Distribution")
-        watchlist_counts = filtered_df['PIF_Watchlist_Status'].value_counts().reset_index(name='Count')
-        watchlist_counts.columns = ['Watchlist_Status', 'Count']
-        fig_watchlist = px.pie(
-            watchlist_counts,
-            values='Count',
-            names=watchlist_counts['Watchlist_Status'].map({True: 'On Watchlist', False: 'Not On Watchlist'}),
-            title='Proportion of Observations for PIF Watchlist Species',
-            hole=0.3
-        )
-        st.plotly_chart(fig_watchlist, use_container_width=True)
+        watchlist_counts = fetch_or_report(fetch_status_counts, 'PIF_Watchlist_Status', *filters)
+        if watchlist_counts is not None:
+            watchlist_counts.columns = ['Watchlist_Status', 'Count']
+            fig_watchlist = px.pie(
+                watchlist_counts,
+                values='Count',
+                names=watchlist_counts['Watchlist_Status'].map({True: 'On Watchlist', False: 'Not On Watchlist'}),
+                title='Proportion of Observations for PIF Watchlist Species',
+                hole=0.3
+            )
+            st.plotly_chart(fig_watchlist, use_container_width=True)
 
         st.subheader("Regional Stewardship Status Distribution")
-        stewardship_counts = filtered_df['Regional_Stewardship_Status'].value_counts().reset_index(name='Count')
-        stewardship_counts.columns = ['Stewardship_Status', 'Count']
-        fig_stewardship = px.pie(
-            stewardship_counts,
-            values='Count',
-            names=stewardship_counts['Stewardship_Status'].map({True: 'Regional Priority', False: 'Not Regional Priority'}),
-            title='Proportion of Observations by Regional Stewardship Status',
-            hole=0.3
-        )
-        st.plotly_chart(fig_stewardship, use_container_width=True)
+        stewardship_counts = fetch_or_report(fetch_status_counts, 'Regional_Stewardship_Status', *filters)
+        if stewardship_counts is not None:
+            stewardship_counts.columns = ['Stewardship_Status', 'Count']
+            fig_stewardship = px.pie(
+                stewardship_counts,
+                values='Count',
+                names=stewardship_counts['Stewardship_Status'].map({True: 'Regional Priority', False: 'Not Regional Priority'}),
+                title='Proportion of Observations by Regional Stewardship Status',
+                hole=0.3
+            )
+            st.plotly_chart(fig_stewardship, use_container_width=True)
 
         st.subheader("Observed At-Risk Species (PIF Watchlist OR Regional Stewardship)")
-        at_risk_species = filtered_df[
-            (filtered_df['PIF_Watchlist_Status'] == True) | 
-            (filtered_df['Regional_Stewardship_Status'] == True)
-        ]
-        if not at_risk_species.empty:
-            at_risk_summary = at_risk_species.groupby(['Location_Type', 'Common_Name']).size().reset_index(name='Count')
+        at_risk_summary = agg_at_risk_species(filtered_df, *filters)
+        if not at_risk_summary.empty:
             fig_at_risk = px.bar(
                 at_risk_summary.sort_values('Count', ascending=False),
                 x='Common_Name',
@@ -453,21 +697,20 @@ else:
         st.header("Observer Trends & Visit Patterns")
 
         st.subheader("Observations by Observer")
-        observer_counts = filtered_df['Observer'].value_counts().nlargest(10).reset_index(name='Count') # Top 10 observers
-        observer_counts.columns = ['Observer', 'Count']
-        fig_observer_obs = px.bar(
-            observer_counts,
-            x='Observer',
-            y='Count',
-            color='Count',
-            title='Top 10 Observers by Total Observations',
-            labels={'Observer': 'Observer Name', 'Count': 'Number of Observations'}
-        )
-        st.plotly_chart(fig_observer_obs, use_container_width=True)
+        observer_counts = fetch_or_report(fetch_top_observers, *filters, limit=10) # Top 10 observers
+        if observer_counts is not None:
+            fig_observer_obs = px.bar(
+                observer_counts,
+                x='Observer',
+                y='Count',
+                color='Count',
+                title='Top 10 Observers by Total Observations',
+                labels={'Observer': 'Observer Name', 'Count': 'Number of Observations'}
+            )
+            st.plotly_chart(fig_observer_obs, use_container_width=True)
 
         st.subheader("Unique Species per Observer")
-        observer_unique_species = filtered_df.groupby('Observer')['Common_Name'].nunique().nlargest(10).reset_index(name='Unique Species Count')
-        observer_unique_species.columns = ['Observer', 'Unique Species Count']
+        observer_unique_species = agg_observer_unique_species(filtered_df, *filters, limit=10)
         fig_observer_unique = px.bar(
             observer_unique_species,
             x='Observer',
@@ -479,11 +722,10 @@ else:
         st.plotly_chart(fig_observer_unique, use_container_width=True)
 
         st.subheader("Visit Patterns to Sites/Plots")
-        visit_counts = filtered_df.groupby(['Site_Name', 'Visit']).size().reset_index(name='Count')
         # Display top 10 sites with their visit patterns
-        top_sites_visits = visit_counts.groupby('Site_Name')['Count'].sum().nlargest(10).index
+        top_sites_visits = agg_visit_patterns(filtered_df, *filters, limit=10)
         fig_visit_pattern = px.bar(
-            visit_counts[visit_counts['Site_Name'].isin(top_sites_visits)].sort_values(['Site_Name', 'Visit']),
+            top_sites_visits,
             x='Visit',
             y='Count',
             color='Site_Name',
@@ -495,8 +737,7 @@ else:
         
         # New: Flyover Observations general overview
         st.subheader("General Flyover Observations")
-        flyover_counts = filtered_df['Flyover_Observed'].value_counts().reset_index(name='Count')
-        flyover_counts.columns = ['Flyover_Observed', 'Count']
+        flyover_counts = agg_value_counts(filtered_df, 'Flyover_Observed', *filters)
         fig_flyover_general = px.pie(
             flyover_counts,
             values='Count',
@@ -511,13 +752,13 @@ else:
     if selected_species != 'All Species':
         st.markdown("---")
         st.header(f"Detailed Analysis for: {selected_species}")
-        species_df = filtered_df[filtered_df['Common_Name'] == selected_species]
+        species_df = filtered_df[category_mask(filtered_df['Common_Name'], [selected_species])]
 
         if not species_df.empty:
             col_s1, col_s2 = st.columns(2)
             with col_s1:
                 st.subheader(f"{selected_species} - Sex Distribution")
-                sex_counts = species_df['Sex'].value_counts().reset_index(name='Count')
+                sex_counts = observed_value_counts(species_df['Sex']).reset_index(name='Count')
                 sex_counts.columns = ['Sex', 'Count']
                 fig_sex = px.pie(
                     sex_counts,
@@ -530,7 +771,7 @@ else:
             
             with col_s2:
                 st.subheader(f"{selected_species} - Identification Methods")
-                id_method_species_counts = species_df['ID_Method'].value_counts().reset_index(name='Count')
+                id_method_species_counts = observed_value_counts(species_df['ID_Method']).reset_index(name='Count')
                 id_method_species_counts.columns = ['ID_Method', 'Count']
                 fig_id_species = px.bar(
                     id_method_species_counts,
@@ -1,13 +1,38 @@
 import pandas as pd
+import numpy as np
+import io
 import os
 import re
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from urllib.parse import quote_plus # Added for URL-encoding password
 
-def load_and_combine_data(folder_path):
+PARQUET_PATH = 'bird_observations.parquet' # Columnar snapshot read by the Streamlit dashboard
+RAW_CACHE_PATH = 'raw_cache.parquet' # Combined raw Excel sheets, reused until a workbook changes
+
+def read_workbook_sheets(file_path, location_type):
+    """
+    Reads every sheet of one Excel workbook, tagging each with its Location_Type and
+    Admin_Unit_Code. Returns a list of (sheet_name, DataFrame) pairs.
+    """
+    # Read all sheets from the Excel file
+    # sheet_name=None reads all sheets into a dictionary of DataFrames
+    # The calamine engine (python-calamine) parses XLSX in Rust, several times faster than openpyxl
+    excel_sheets_dict = pd.read_excel(file_path, sheet_name=None, engine='calamine')
+    
+    for sheet_name, df_sheet in excel_sheets_dict.items():
+        # Add Location_Type from the Excel file's context
+        df_sheet['Location_Type'] = location_type.capitalize() # 'Forest' or 'Grassland'
+        
+        # The sheet name itself is the Admin_Unit_Code
+        df_sheet['Admin_Unit_Code'] = sheet_name 
+    return list(excel_sheets_dict.items())
+
+def load_and_combine_data(folder_path, use_cache=True):
     """
     Loads data from both multi-sheet Excel files (Forest and Grassland),
     extracts data from all sheets, and combines them into a single DataFrame.
+    The combined sheets are cached as Parquet; later runs read the cache instead
+    of parsing the workbooks again, unless a workbook is newer than the cache.
     """
     all_data = []
     
@@ -16,6 +41,14 @@ def load_and_combine_data(folder_path):
         'GRASSLAND': 'Bird_Monitoring_Data_GRASSLAND.XLSX'
     }
 
+    cache_path = os.path.join(folder_path, RAW_CACHE_PATH)
+    excel_paths = [os.path.join(folder_path, filename) for filename in excel_files.values()]
+    if use_cache and os.path.exists(cache_path) and all(
+        os.path.getmtime(path) <= os.path.getmtime(cache_path) for path in excel_paths if os.path.exists(path)
+    ):
+        print(f"Reading combined raw data from cache '{RAW_CACHE_PATH}' (delete it to re-read the Excel files)...")
+        return pd.read_parquet(cache_path, engine='pyarrow')
+
     for location_type, filename_excel in excel_files.items():
         file_path = os.path.join(folder_path, filename_excel)
         
@@ -25,18 +58,10 @@ def load_and_combine_data(folder_path):
 
         print(f"Reading all sheets from '{filename_excel}' for {location_type} data...")
         try:
-            # Read all sheets from the Excel file
-            # sheet_name=None reads all sheets into a dictionary of DataFrames
-            excel_sheets_dict = pd.read_excel(file_path, sheet_name=None, engine='openpyxl')
-            
-            for sheet_name, df_sheet in excel_sheets_dict.items():
-                # Add Location_Type from the Excel file's context
-                df_sheet['Location_Type'] = location_type.capitalize() # 'Forest' or 'Grassland'
-                
-                # The sheet name itself is the Admin_Unit_Code
-                df_sheet['Admin_Unit_Code'] = sheet_name 
-                
-                all_data.append(df_sheet)
+            for sheet_name, df_sheet in read_workbook_sheets(file_path, location_type):
+                # Empty sheets add nothing but all-NA object columns to the concatenation
+                if not df_sheet.empty:
+                    all_data.append(df_sheet)
                 print(f"  - Loaded sheet: '{sheet_name}' ({df_sheet.shape[0]} rows)")
 
         except Exception as e:
@@ -47,8 +72,22 @@ def load_and_combine_data(folder_path):
         return pd.DataFrame() # Return empty DataFrame if no data
 
     combined_df = pd.concat(all_data, ignore_index=True)
+    if use_cache:
+        combined_df.to_parquet(cache_path, engine='pyarrow', compression='zstd')
     return combined_df
 
+def to_bool_flags(series):
+    """
+    Coerces TRUE/FALSE-like values (any case) to a NumPy bool array; anything else,
+    including missing values, becomes False.
+    """
+    if series.dtype == bool:
+        return series.to_numpy() # The calamine engine already returns real booleans
+    # Factorize in one pass so the string test runs once per distinct value, not once per row
+    codes, uniques = pd.factorize(series)
+    is_true = np.array([str(value).upper() == 'TRUE' for value in uniques], dtype=bool)
+    return np.append(is_true, False)[codes] # Code -1 (missing) picks the trailing False
+
 def initial_data_cleaning(df):
     """
     Performs initial data cleaning steps.
@@ -61,12 +100,15 @@ def initial_data_cleaning(df):
 
     # Convert 'Date' column to proper datetime objects, explicitly specifying format
     # Based on previous warning, assuming DD-MM-YYYY format (e.g., 25-01-2023)
-    df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y', errors='coerce') 
+    # Survey dates repeat across many rows, so each distinct string is parsed once (cache=True)
+    # and broadcast; cells the Excel reader already returned as dates need no parsing at all
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y', errors='coerce', cache=True) 
     
     # Handle boolean-like strings to actual booleans (True/False)
     for col in ['Flyover_Observed', 'PIF_Watchlist_Status', 'Regional_Stewardship_Status']:
         if col in df.columns:
-            df[col] = df[col].astype(str).str.upper().map({'TRUE': True, 'FALSE': False}).fillna(False)
+            df[col] = to_bool_flags(df[col])
 
     # Convert numerical columns, handling missing/invalid data
     numeric_cols = ['Temperature', 'Humidity', 'Initial_Three_Min_Cnt', 'AcceptedTSN', 'AOU_Code', 'Visit']
@@ -74,16 +116,20 @@ def initial_data_cleaning(df):
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors='coerce') # Convert to number, put NaN for errors
             
-            if col in ['Initial_Three_Min_Cnt', 'Visit']:
-                df[col] = df[col].fillna(0).astype(int) # For counts/visits, fill missing with 0 and convert to integer
-            elif col in ['AcceptedTSN', 'AOU_Code']:
-                df[col] = df[col].fillna(-1).astype(int) # For codes, fill missing with -1 and convert to integer
+            if col in ['Initial_Three_Min_Cnt', 'Visit', 'AcceptedTSN', 'AOU_Code']:
+                # For counts/visits, fill missing with 0; for codes, fill missing with -1.
+                # The fill happens on one float buffer, stored as int32 (all values fit easily)
+                values = df[col].to_numpy(dtype=np.float64)
+                values[np.isnan(values)] = 0 if col in ['Initial_Three_Min_Cnt', 'Visit'] else -1
+                df[col] = values.astype(np.int32)
             else:
-                # For Temperature/Humidity, fill missing with the mean of the column
-                if not df[col].isnull().all():
-                    df[col] = df[col].fillna(df[col].mean())
-                else:
-                    df[col] = df[col].fillna(0) # Or another sensible default if all are NaN
+                # For Temperature/Humidity, fill missing with the mean of the column,
+                # imputed on the float buffer directly rather than through Series.fillna
+                values = df[col].to_numpy(dtype=np.float64)
+                missing = np.isnan(values)
+                if missing.any():
+                    fill_value = np.nanmean(values) if not missing.all() else 0.0 # Or another sensible default if all are NaN
+                    df[col] = np.where(missing, fill_value, values)
 
     # Fill missing categorical values with 'Unknown' for consistency
     categorical_cols = [
@@ -92,9 +138,8 @@ def initial_data_cleaning(df):
         'Plot_Name', 'Observer', 'Interval_Length', 'NPSTaxonCode',
         'TaxonCode', 'Previously_Obs'
     ]
-    for col in categorical_cols:
-        if col in df.columns:
-            df[col] = df[col].fillna('Unknown')
+    # One fillna call over all present columns instead of one new Series per column
+    df.fillna({col: 'Unknown' for col in categorical_cols if col in df.columns}, inplace=True)
     
     # Ensure 'Year' column is correctly inferred or derived from 'Date' if missing
     # Assuming 'Year' is primarily from original data, but can cross-check with 'Date'
@@ -104,9 +149,80 @@ def initial_data_cleaning(df):
     print("Shape after initial cleaning:", df.shape)
     return df
 
+def save_to_parquet(df, path=PARQUET_PATH):
+    """
+    Saves the cleaned DataFrame as a zstd-compressed Parquet dataset partitioned
+    by Location_Type, so readers can load only the columns and habitats they need.
+    """
+    # Columns mixing numeric codes with the 'Unknown' fill have no single Arrow type; store them as text
+    mixed_cols = [
+        col for col in df.select_dtypes(include='object').columns
+        if pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed')
+    ]
+    df = df.astype({col: str for col in mixed_cols})
+    df.to_parquet(
+        path,
+        engine='pyarrow',
+        compression='zstd',
+        row_group_size=200_000,
+        partition_cols=['Location_Type'],
+        existing_data_behavior='delete_matching' # Overwrite partitions from previous runs
+    )
+    print(f"Cleaned data saved to Parquet dataset '{path}'")
+
+def create_indexes(conn):
+    """
+    Creates the indexes used by the dashboard's filtered aggregate queries
+    (habitat, observation year and observer predicates).
+    """
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS "idx_bird_observations_filters" ON "bird_observations" '
+        '("Location_Type", (EXTRACT(YEAR FROM "Date")), "Observer")'
+    ))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS "idx_bird_observations_year" ON "bird_observations" '
+        '((EXTRACT(YEAR FROM "Date")))'
+    ))
+    print("Indexes created on 'bird_observations'.")
+
+# Rows serialised per COPY: bounds the CSV text held in memory to one slice rather than the whole frame
+COPY_CHUNK_ROWS = 50000
+
+def copy_dataframe(df, table_name, conn, freeze=False):
+    """
+    Bulk-loads a DataFrame into an existing PostgreSQL table with COPY FROM STDIN,
+    streaming the rows as CSV instead of batched INSERTs. The frame is sent in slices of
+    COPY_CHUNK_ROWS rows so only one slice's CSV text exists at a time.
+    """
+    columns = ', '.join(f'"{col}"' for col in df.columns)
+    # FREEZE writes the rows as already frozen (no later VACUUM pass over a fresh table);
+    # PostgreSQL only allows it when the table was created in the current transaction
+    options = "FORMAT CSV, NULL '\\N', FREEZE" if freeze else "FORMAT CSV, NULL '\\N'"
+    statement = f'COPY "{table_name}" ({columns}) FROM STDIN WITH ({options})'
+    # COPY is a psycopg2 cursor feature, so go through the underlying DBAPI connection
+    with conn.connection.cursor() as cursor:
+        for start in range(0, len(df), COPY_CHUNK_ROWS):
+            buffer = io.StringIO()
+            df.iloc[start:start + COPY_CHUNK_ROWS].to_csv(buffer, index=False, header=False, na_rep='\\N')
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+
+# PostgreSQL accepts at most 65535 bind parameters in one statement
+MAX_BIND_PARAMS = 65535
+
+def insert_dataframe(df, table_name, conn):
+    """
+    Fallback bulk load for drivers without COPY support, using multi-row INSERTs.
+    Each chunk goes out as one INSERT ... VALUES statement instead of one INSERT per row.
+    Chunks are capped at 5000 rows, above which larger batches stop paying off, and kept
+    under the bind-parameter limit (rows x columns) so wide frames still fit in one statement.
+    """
+    chunksize = min(5000, MAX_BIND_PARAMS // len(df.columns))
+    df.to_sql(table_name, conn, if_exists='append', index=False, chunksize=chunksize, method='multi')
+
 def upload_to_sql(df):
     """
-    Uploads the DataFrame to a PostgreSQL database.
+    Uploads the DataFrame to a PostgreSQL database. Returns True if the new table was committed.
     """
     # --- PostgreSQL Connection Details ---
     # These values are based on your confirmed setup:
@@ -125,13 +241,24 @@ def upload_to_sql(df):
     
     print(f"Uploading data to PostgreSQL database: {PG_DB_NAME}...")
     try:
-        # 'replace' will delete the table if it exists and create a new one.
-        df.to_sql('bird_observations', engine, if_exists='replace', index=False, chunksize=1000)
+        # One transaction: a failed load leaves the previous table in place
+        with engine.begin() as conn:
+            # Delete the table if it exists and create a new, empty one with the column types pandas infers from df
+            conn.execute(text('DROP TABLE IF EXISTS "bird_observations"'))
+            conn.execute(text(pd.io.sql.get_schema(df, 'bird_observations', con=conn)))
+            if conn.dialect.driver == 'psycopg2':
+                copy_dataframe(df, 'bird_observations', conn, freeze=True)
+            else:
+                insert_dataframe(df, 'bird_observations', conn)
+            # Indexes are built once after the load rather than maintained row by row during it
+            create_indexes(conn)
         print("Data uploaded successfully to PostgreSQL.")
+        return True
     except Exception as e:
         print(f"Error uploading data to PostgreSQL: {e}")
         print("Please ensure your PostgreSQL server is running and connection details in this script are correct.")
         print(f"Attempted connection string (without password shown): postgresql://{PG_USERNAME}:*****@{PG_HOST}:{PG_PORT}/{PG_DB_NAME}")
+        return False
 
 if __name__ == "__main__":
     current_directory = os.getcwd()
@@ -141,7 +268,9 @@ if __name__ == "__main__":
 
     if not combined_df.empty:
         print("Performing initial data cleaning...")
-        cleaned_df = initial_data_cleaning(combined_df.copy())
+        # Cleaning works in place and the raw frame is not used again, so no defensive copy is made
+        cleaned_df = initial_data_cleaning(combined_df)
+        del combined_df
         
         print("\n--- Data Cleaning Summary ---")
         print(cleaned_df.info())
@@ -152,6 +281,11 @@ if __name__ == "__main__":
         cleaned_df.to_csv('cleaned_bird_observations.csv', index=False)
         print("\nCleaned data saved to 'cleaned_bird_observations.csv'")
 
-        upload_to_sql(cleaned_df)
+        # The dashboard reads both the Parquet snapshot and the PostgreSQL table, so the snapshot
+        # is only replaced once the upload has committed; otherwise both keep the previous data
+        if upload_to_sql(cleaned_df):
+            save_to_parquet(cleaned_df)
+        else:
+            print(f"Parquet snapshot '{PARQUET_PATH}' was not updated, so it still matches the PostgreSQL table.")
     else:
         print("No data was loaded. Please check if Excel files are in the correct directory and named correctly.")
\ No newline at end of file
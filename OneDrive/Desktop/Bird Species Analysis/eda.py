@@ -1,9 +1,11 @@
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.io as pio # To save plotly figures
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from urllib.parse import quote_plus # For encoding password
 import os
+import argparse
 
 # --- Database Connection Details ---
 # IMPORTANT: These must match your PostgreSQL setup
@@ -16,38 +18,33 @@ PG_DB_NAME = 'bird_analysis_db'    # Your confirmed database name
 # URL-encode the password for the connection string
 encoded_password = quote_plus(PG_PASSWORD)
 DATABASE_URL = f'postgresql://{PG_USERNAME}:{encoded_password}@{PG_HOST}:{PG_PORT}/{PG_DB_NAME}'
+# Shared by every query in this script so they reuse pooled connections instead of reconnecting
+# (create_engine does not connect until the first query)
+engine = create_engine(DATABASE_URL, pool_size=4, max_overflow=0)
 
 # --- Output Folder for Plots ---
 EDA_PLOTS_DIR = 'eda_plots'
 os.makedirs(EDA_PLOTS_DIR, exist_ok=True) # Create the directory if it doesn't exist
 
 # --- Data Loading Function ---
+# Columns the row-level plots use; the counting plots come from the aggregate queries below
+EDA_COLUMNS = [
+    'Common_Name', 'Site_Name', 'Plot_Name', 'Admin_Unit_Code', 'Location_Type',
+    'Sex', 'ID_Method', 'Wind', 'Disturbance', 'Temperature',
+    'PIF_Watchlist_Status', 'Regional_Stewardship_Status'
+]
+
 def get_data_from_sql():
-    """Fetches data from the SQL database and performs initial processing."""
-    engine = create_engine(DATABASE_URL)
+    """Fetches the columns used by the EDA from the SQL database."""
     try:
         print("Fetching data from PostgreSQL...")
-        df = pd.read_sql('SELECT * FROM "bird_observations"', engine)
+        columns = ', '.join(f'"{col}"' for col in EDA_COLUMNS)
+        # Arrow-backed columns keep the types PostgreSQL reports (text, double, boolean),
+        # so no per-column re-inference or casting is needed after the read
+        with engine.connect() as conn:
+            df = pd.read_sql(text(f'SELECT {columns} FROM "bird_observations"'), conn, dtype_backend='pyarrow')
         print(f"Data fetched. Shape: {df.shape}")
 
-        # Ensure correct data types for analysis and plotting
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df['ObservationYear'] = df['Date'].dt.year.fillna(0).astype(int)
-        df['ObservationMonth'] = df['Date'].dt.month.fillna(0).astype(int)
-        
-        # Convert Start_Time to extract hour
-        df['Start_Time_DT'] = pd.to_datetime(df['Start_Time'], format='%H:%M:%S', errors='coerce')
-        df['ObservationHour'] = df['Start_Time_DT'].dt.hour.fillna(-1).astype(int)
-
-        # Convert boolean columns to actual booleans
-        df['PIF_Watchlist_Status'] = df['PIF_Watchlist_Status'].astype(bool)
-        df['Regional_Stewardship_Status'] = df['Regional_Stewardship_Status'].astype(bool)
-        df['Flyover_Observed'] = df['Flyover_Observed'].astype(bool)
-
-        # Convert Distance to an ordered categorical type for better plotting order
-        distance_order = ['<=50 Meters', '50-100 Meters', '>100 Meters', 'Unknown']
-        df['Distance'] = pd.Categorical(df['Distance'], categories=distance_order, ordered=True)
-
         print("Data preparation for EDA complete.")
         return df
     except Exception as e:
@@ -55,22 +52,117 @@ def get_data_from_sql():
         print("Please ensure your PostgreSQL server is running and connection details are correct.")
         return pd.DataFrame()
 
+# --- Aggregate Queries ---
+# The counting plots are GROUP BY queries run by PostgreSQL, so only their few result
+# rows are transferred instead of being recounted from every observation in pandas.
+def run_aggregate_query(query, **params):
+    """Runs an aggregate query against the bird_observations table and returns its result."""
+    with engine.connect() as conn:
+        return pd.read_sql(text(query), conn, params=params)
+
+TEMPORAL_KEYS = ['ObservationYear', 'ObservationMonth', 'Hour']
+
+def fetch_temporal_cube():
+    """
+    Observation counts per (year, month, hour of day) from a single scan of the table.
+    A missing key (<NA>) marks rows without a date or start time.
+    """
+    cube = run_aggregate_query('''
+        SELECT CAST(EXTRACT(YEAR FROM "Date") AS INTEGER) AS "ObservationYear",
+               CAST(EXTRACT(MONTH FROM "Date") AS INTEGER) AS "ObservationMonth",
+               CAST(EXTRACT(HOUR FROM "Start_Time") AS INTEGER) AS "Hour",
+               COUNT(*) AS "Count"
+        FROM "bird_observations"
+        GROUP BY 1, 2, 3
+    ''')
+    return cube.astype({key: 'Int64' for key in TEMPORAL_KEYS}) # Nullable keys stay integers
+
+def project_cube(cube, key):
+    """Total counts per value of one cube key (ascending), skipping rows where it is missing."""
+    return cube.groupby(key)['Count'].sum().reset_index()
+
+def fetch_top_sites(limit=15):
+    """Sites with the most observations."""
+    return run_aggregate_query('''
+        SELECT "Site_Name", COUNT(*) AS "Count"
+        FROM "bird_observations"
+        GROUP BY "Site_Name"
+        ORDER BY "Count" DESC, "Site_Name"
+        LIMIT :limit
+    ''', limit=limit)
+
+def fetch_top_species(limit=15):
+    """Most frequently observed species."""
+    return run_aggregate_query('''
+        SELECT "Common_Name", COUNT(*) AS "Count"
+        FROM "bird_observations"
+        GROUP BY "Common_Name"
+        ORDER BY "Count" DESC, "Common_Name"
+        LIMIT :limit
+    ''', limit=limit)
+
 # --- EDA and Plotting Functions ---
 
-def plot_and_save(fig, filename, title):
-    """Saves a Plotly figure to the EDA_PLOTS_DIR."""
-    filepath_png = os.path.join(EDA_PLOTS_DIR, f"{filename}.png")
+def plot_and_save(fig, filename, title, png=False):
+    """
+    Saves a Plotly figure to the EDA_PLOTS_DIR as interactive HTML, plus a static PNG
+    when png=True. PNG export goes through Kaleido's headless browser and dominates the
+    run time, so draft runs skip it.
+    """
     filepath_html = os.path.join(EDA_PLOTS_DIR, f"{filename}.html")
-    
+    # Save as interactive HTML (a full page, so it declares its UTF-8 charset); validate=False
+    # skips re-checking the figure Plotly Express already built against the schema
+    pio.write_html(fig, filepath_html, include_plotlyjs='cdn', validate=False, auto_play=False)
+    if not png:
+        print(f"Saved plot: '{title}' to {filepath_html}")
+        return
+
+    filepath_png = os.path.join(EDA_PLOTS_DIR, f"{filename}.png")
     pio.write_image(fig, filepath_png, scale=2) # Save as high-res PNG
-    pio.write_html(fig, filepath_html, include_plotlyjs='cdn') # Save as interactive HTML
     print(f"Saved plot: '{title}' to {filepath_png} and {filepath_html}")
 
-
-def perform_eda_and_plot(df):
-    """Performs various EDA analyses and generates plots."""
+def top_counts(series, k, label):
+    """
+    The k most frequent values of a series as a [label, 'Count'] frame, largest first.
+    argpartition selects the top k in linear time; only those k rows are sorted.
+    """
+    counts = series.value_counts(sort=False)
+    values = counts.to_numpy()
+    if len(values) > k:
+        counts = counts.iloc[np.argpartition(-values, k - 1)[:k]]
+    # Zero counts come from categories absent in a subset and are not shown
+    counts = counts[counts > 0].sort_values(ascending=False, kind='stable')
+    return pd.DataFrame({label: counts.index, 'Count': counts.to_numpy()})
+
+def save_plots(plots, png=False):
+    """
+    Writes queued (fig, filename, title) plots as HTML and, when png=True, exports all the
+    PNGs in one pio.write_images batch so Kaleido's browser is started once, not per figure.
+    """
+    for fig, filename, title in plots:
+        plot_and_save(fig, filename, title)
+
+    if png and plots:
+        filepaths_png = [os.path.join(EDA_PLOTS_DIR, f"{filename}.png") for _, filename, _ in plots]
+        pio.write_images([fig for fig, _, _ in plots], filepaths_png, scale=2) # High-res PNGs
+        print(f"Saved {len(filepaths_png)} static PNG plots to {EDA_PLOTS_DIR}")
+
+
+# Repetitive text columns counted by the EDA; as categoricals they are grouped on integer codes
+EDA_CATEGORICAL_COLS = [
+    'Common_Name', 'Site_Name', 'Wind', 'Sex', 'ID_Method', 'Disturbance',
+    'Location_Type', 'Plot_Name', 'Admin_Unit_Code'
+]
+
+def perform_eda_and_plot(df, png=False):
+    """Performs various EDA analyses and generates plots (static PNGs too when png=True)."""
 
     print("\n--- Performing EDA and Generating Plots ---")
+    queued_plots = [] # (fig, filename, title) tuples, written together at the end
+
+    # Convert once up front so every value_counts/groupby below works on category codes
+    present_cols = [col for col in EDA_CATEGORICAL_COLS if col in df.columns]
+    df[present_cols] = df[present_cols].astype('category')
 
     # 1. Overall Data Overview
     print("Generating Overall Data Overview plots...")
@@ -87,36 +179,36 @@ def perform_eda_and_plot(df):
     
     # 2. Temporal Analysis
     print("Generating Temporal Analysis plots...")
-    # Observations by Month
-    valid_temporal_df = df[df['ObservationMonth'] > 0] # Filter out invalid dates
-    if not valid_temporal_df.empty:
-        observations_by_month = valid_temporal_df.groupby('ObservationMonth').size().reset_index(name='Count')
+    # Monthly, yearly and hourly counts are all projections of one (year, month, hour) cube
+    temporal_cube = fetch_temporal_cube()
+
+    # Observations by Month (rows with invalid dates are skipped)
+    observations_by_month = project_cube(temporal_cube, 'ObservationMonth')
+    if not observations_by_month.empty:
         month_names = {1: 'Jan', 2: 'Feb', 3: 'Mar', 4: 'Apr', 5: 'May', 6: 'Jun', 
                        7: 'Jul', 8: 'Aug', 9: 'Sep', 10: 'Oct', 11: 'Nov', 12: 'Dec'}
         observations_by_month['Month_Name'] = observations_by_month['ObservationMonth'].map(month_names)
         fig_monthly = px.bar(observations_by_month.sort_values('ObservationMonth'), x='Month_Name', y='Count',
                              title='Total Observations by Month', labels={'Month_Name': 'Month', 'Count': 'Number of Observations'})
-        plot_and_save(fig_monthly, 'temporal_monthly_observations', 'Total Observations by Month')
+        queued_plots.append((fig_monthly, 'temporal_monthly_observations', 'Total Observations by Month'))
     else:
         print("Skipping monthly observations plot due to no valid date data.")
 
     # Observations by Year
-    if not valid_temporal_df.empty:
-        observations_by_year = valid_temporal_df.groupby('ObservationYear').size().reset_index(name='Count')
+    observations_by_year = project_cube(temporal_cube, 'ObservationYear')
+    if not observations_by_year.empty:
         fig_yearly = px.line(observations_by_year, x='ObservationYear', y='Count',
                              title='Total Observations Per Year', labels={'ObservationYear': 'Year', 'Count': 'Number of Observations'})
-        plot_and_save(fig_yearly, 'temporal_yearly_observations', 'Total Observations Per Year')
+        queued_plots.append((fig_yearly, 'temporal_yearly_observations', 'Total Observations Per Year'))
     else:
         print("Skipping yearly observations plot due to no valid date data.")
 
     # Observations by Hour of Day
-    valid_hourly_df = df[df['ObservationHour'] != -1] # Filter out invalid hours
-    if not valid_hourly_df.empty:
-        hourly_counts = valid_hourly_df['ObservationHour'].value_counts().sort_index().reset_index()
-        hourly_counts.columns = ['Hour', 'Count']
+    hourly_counts = project_cube(temporal_cube, 'Hour') # Rows with invalid times are skipped
+    if not hourly_counts.empty:
         fig_hourly = px.bar(hourly_counts, x='Hour', y='Count',
                             title='Observations by Hour of Day', labels={'Hour': 'Hour of Day', 'Count': 'Number of Observations'})
-        plot_and_save(fig_hourly, 'temporal_hourly_observations', 'Observations by Hour of Day')
+        queued_plots.append((fig_hourly, 'temporal_hourly_observations', 'Observations by Hour of Day'))
     else:
         print("Skipping hourly observations plot due to no valid time data.")
 
@@ -124,48 +216,50 @@ def perform_eda_and_plot(df):
     # 3. Spatial Analysis
     print("Generating Spatial Analysis plots...")
     # Species diversity by Location Type
-    species_diversity_loc = df.groupby('Location_Type')['Common_Name'].nunique().reset_index(name='Unique_Species_Count')
+    species_diversity_loc = df.groupby('Location_Type', observed=True).agg(
+        Unique_Species_Count=('Common_Name', 'nunique')
+    ).reset_index()
     fig_diversity_loc = px.bar(species_diversity_loc, x='Location_Type', y='Unique_Species_Count', color='Location_Type',
                                title='Unique Species Count by Habitat Type', labels={'Location_Type': 'Habitat Type', 'Unique_Species_Count': 'Number of Unique Species'}, text='Unique_Species_Count')
-    plot_and_save(fig_diversity_loc, 'spatial_species_diversity_by_habitat', 'Unique Species Count by Habitat Type')
+    queued_plots.append((fig_diversity_loc, 'spatial_species_diversity_by_habitat', 'Unique Species Count by Habitat Type'))
 
     # Top 15 Observation Sites by Count
-    obs_per_site = df['Site_Name'].value_counts().nlargest(15).reset_index(name='Count')
-    obs_per_site.columns = ['Site_Name', 'Count']
+    obs_per_site = fetch_top_sites(limit=15)
     fig_site_obs = px.bar(obs_per_site, x='Site_Name', y='Count', color='Count',
                           title='Top 15 Observation Sites (by Count)', labels={'Site_Name': 'Site Name', 'Count': 'Number of Observations'})
-    plot_and_save(fig_site_obs, 'spatial_top_sites_by_observations', 'Top 15 Observation Sites by Count')
+    queued_plots.append((fig_site_obs, 'spatial_top_sites_by_observations', 'Top 15 Observation Sites by Count'))
 
     # Top 10 Plots by Unique Species
-    plot_diversity = df.groupby(['Admin_Unit_Code', 'Plot_Name'])['Common_Name'].nunique().reset_index(name='Unique_Species_Count')
-    plot_diversity_sorted = plot_diversity.sort_values(by='Unique_Species_Count', ascending=False).head(10)
+    plot_diversity = df.groupby(['Admin_Unit_Code', 'Plot_Name'], observed=True).agg(
+        Unique_Species_Count=('Common_Name', 'nunique')
+    ).reset_index()
+    plot_diversity_sorted = plot_diversity.nlargest(10, 'Unique_Species_Count') # Partial selection, not a full sort
     fig_plot_diversity = px.bar(plot_diversity_sorted, x='Plot_Name', y='Unique_Species_Count', color='Admin_Unit_Code',
                                 title='Top 10 Plots by Unique Species Count', labels={'Plot_Name': 'Plot Name', 'Unique_Species_Count': 'Unique Species Count'})
-    plot_and_save(fig_plot_diversity, 'spatial_top_plots_by_species', 'Top 10 Plots by Unique Species Count')
+    queued_plots.append((fig_plot_diversity, 'spatial_top_plots_by_species', 'Top 10 Plots by Unique Species Count'))
 
 
     # 4. Species Analysis
     print("Generating Species Analysis plots...")
     # Top 15 most frequently observed species
-    top_species = df['Common_Name'].value_counts().nlargest(15).reset_index(name='Count')
-    top_species.columns = ['Common_Name', 'Count']
+    top_species = fetch_top_species(limit=15)
     fig_top_species = px.bar(top_species, x='Common_Name', y='Count', color='Count',
                              title='Top 15 Most Frequently Observed Bird Species', labels={'Common_Name': 'Bird Species', 'Count': 'Number of Observations'})
-    plot_and_save(fig_top_species, 'species_top_observed', 'Top 15 Most Observed Species')
+    queued_plots.append((fig_top_species, 'species_top_observed', 'Top 15 Most Observed Species'))
 
     # ID Method Distribution
     id_method_counts = df['ID_Method'].value_counts().reset_index(name='Count')
     id_method_counts.columns = ['ID_Method', 'Count']
     fig_id_method = px.pie(id_method_counts, values='Count', names='ID_Method',
                            title='Distribution of Identification Methods', hole=0.3)
-    plot_and_save(fig_id_method, 'species_id_method_distribution', 'ID Method Distribution')
+    queued_plots.append((fig_id_method, 'species_id_method_distribution', 'ID Method Distribution'))
 
     # Sex Ratio
     sex_counts = df['Sex'].value_counts().reset_index(name='Count')
     sex_counts.columns = ['Sex', 'Count']
     fig_sex_ratio = px.pie(sex_counts, values='Count', names='Sex',
                            title='Overall Sex Distribution of Observed Birds', hole=0.3)
-    plot_and_save(fig_sex_ratio, 'species_sex_ratio', 'Overall Sex Ratio')
+    queued_plots.append((fig_sex_ratio, 'species_sex_ratio', 'Overall Sex Ratio'))
 
 
     # 5. Environmental Conditions Analysis
@@ -175,7 +269,7 @@ def perform_eda_and_plot(df):
     if not valid_temp_df.empty:
         fig_temp_dist = px.histogram(valid_temp_df, x='Temperature', nbins=20,
                                      title='Distribution of Observations by Temperature', labels={'Temperature': 'Temperature (°C)'})
-        plot_and_save(fig_temp_dist, 'env_temperature_distribution', 'Temperature Distribution')
+        queued_plots.append((fig_temp_dist, 'env_temperature_distribution', 'Temperature Distribution'))
     else:
         print("Skipping temperature distribution plot due to no valid temperature data.")
 
@@ -184,14 +278,14 @@ def perform_eda_and_plot(df):
     wind_counts.columns = ['Wind_Condition', 'Count']
     fig_wind_cond = px.bar(wind_counts, x='Wind_Condition', y='Count', color='Count',
                            title='Observations by Wind Condition', labels={'Wind_Condition': 'Wind Condition', 'Count': 'Number of Observations'})
-    plot_and_save(fig_wind_cond, 'env_wind_conditions', 'Observations by Wind Condition')
+    queued_plots.append((fig_wind_cond, 'env_wind_conditions', 'Observations by Wind Condition'))
 
     # Disturbance Effect
     disturbance_counts = df['Disturbance'].value_counts().reset_index(name='Count')
     disturbance_counts.columns = ['Disturbance_Type', 'Count']
     fig_disturbance = px.bar(disturbance_counts, x='Disturbance_Type', y='Count', color='Count',
                              title='Observations by Reported Disturbance', labels={'Disturbance_Type': 'Disturbance Type', 'Count': 'Number of Observations'})
-    plot_and_save(fig_disturbance, 'env_disturbance_effect', 'Observations by Disturbance Effect')
+    queued_plots.append((fig_disturbance, 'env_disturbance_effect', 'Observations by Disturbance Effect'))
 
 
     # 6. Conservation Insights
@@ -202,7 +296,7 @@ def perform_eda_and_plot(df):
     fig_watchlist = px.pie(watchlist_counts, values='Count',
                            names=watchlist_counts['Watchlist_Status'].map({True: 'On Watchlist', False: 'Not On Watchlist'}),
                            title='Proportion of Observations for PIF Watchlist Species', hole=0.3)
-    plot_and_save(fig_watchlist, 'conservation_pif_watchlist', 'PIF Watchlist Status')
+    queued_plots.append((fig_watchlist, 'conservation_pif_watchlist', 'PIF Watchlist Status'))
 
     # Regional Stewardship Status
     stewardship_counts = df['Regional_Stewardship_Status'].value_counts().reset_index(name='Count')
@@ -210,25 +304,30 @@ def perform_eda_and_plot(df):
     fig_stewardship = px.pie(stewardship_counts, values='Count',
                              names=stewardship_counts['Stewardship_Status'].map({True: 'Regional Priority', False: 'Not Regional Priority'}),
                              title='Proportion of Observations by Regional Stewardship Status', hole=0.3)
-    plot_and_save(fig_stewardship, 'conservation_regional_stewardship', 'Regional Stewardship Status')
+    queued_plots.append((fig_stewardship, 'conservation_regional_stewardship', 'Regional Stewardship Status'))
 
     # Top At-Risk Species by Observation Count
     at_risk_species = df[(df['PIF_Watchlist_Status'] == True) | (df['Regional_Stewardship_Status'] == True)]
     if not at_risk_species.empty:
-        at_risk_summary = at_risk_species['Common_Name'].value_counts().nlargest(10).reset_index(name='Count')
-        at_risk_summary.columns = ['Common_Name', 'Count']
+        at_risk_summary = top_counts(at_risk_species['Common_Name'], 10, 'Common_Name')
         fig_at_risk = px.bar(at_risk_summary, x='Common_Name', y='Count', color='Count',
                              title='Top 10 Observed At-Risk Species (by Count)', labels={'Common_Name': 'Species', 'Count': 'Number of Observations'})
-        plot_and_save(fig_at_risk, 'conservation_top_at_risk_species', 'Top 10 Observed At-Risk Species')
+        queued_plots.append((fig_at_risk, 'conservation_top_at_risk_species', 'Top 10 Observed At-Risk Species'))
     else:
         print("No at-risk species observed in the dataset.")
 
+    save_plots(queued_plots, png=png)
     print("\nEDA and plot generation complete. Check the 'eda_plots' folder for output files.")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exploratory data analysis of the bird observations.")
+    parser.add_argument('--final', action='store_true',
+                        help="also export static PNG plots for the report (slower; needs kaleido)")
+    args = parser.parse_args()
+
     df_observations = get_data_from_sql()
     if not df_observations.empty:
-        perform_eda_and_plot(df_observations)
+        perform_eda_and_plot(df_observations, png=args.final)
     else:
         print("Cannot perform EDA as no data was loaded.")
\ No newline at end of file